@@ -2,18 +2,29 @@
 """
 FCSP State Monitor
 A simple monitoring app that polls the FCSP device every 30 seconds
-and reports only when state changes are detected.
+and reports only when state changes are detected. While the state is
+stable the polling interval backs off up to a configurable maximum.
+In push mode a webhook POST triggers an immediate poll, and regular
+polling only runs as a slow safety net while pushes keep arriving.
 """
 
-from fcsp_api import FCSP
+from fcsp_api import AsyncFCSP, FCSPError, FCSPAPIError, get_config
 from datetime import datetime
-import time
+from pathlib import Path
+from types import MappingProxyType
 import argparse
+import asyncio
+import atexit
+import json
+import operator
+import os
+import random
+import time
 import signal
 import sys
 
 # State definitions from real-world testing
-DEVICE_STATES = {
+DEVICE_STATES = MappingProxyType({
     'CS00': {
         'name': 'Available',
         'description': 'No vehicle connected - Ready for charging',
@@ -34,24 +45,95 @@ DEVICE_STATES = {
         'description': 'Possible error or fault condition',
         'icon': '🔴'
     }
-}
+})
+
+# dict.get('state') bound once, so extracting inverter states stays in C
+_get_state = operator.methodcaller('get', 'state')
+
+# Fallback for states not listed above
+_UNKNOWN = MappingProxyType({'name': 'Unknown', 'icon': '❓'})
+
+
+def _state_label(state):
+    """
+    Look up how to display a device state
+    
+    Args:
+        state: Device state code (e.g. 'CS00')
+        
+    Returns:
+        tuple: (icon, name)
+    """
+    info = DEVICE_STATES.get(state) or _UNKNOWN
+    if info is _UNKNOWN:
+        return info['icon'], f"Unknown ({state})"
+    return info['icon'], info['name']
+
+# Number of consecutive unchanged polls before the polling interval is doubled
+BACKOFF_AFTER_STABLE_POLLS = 3
+
+# Longest wait in seconds between reconnection attempts (before jitter)
+MAX_RETRY_BACKOFF = 60
+
+# Last observed state, used as the baseline when the monitor restarts shortly after stopping.
+# {host} is replaced with the configured device so monitors of different chargers don't collide.
+STATE_CACHE_FILE = "~/.cache/fcsp_monitor/state-{host}.json"
+
+# Push mode falls back to regular polling if no push arrives for this many seconds
+PUSH_GRACE_PERIOD = 3600
+
+# Limits for reading a webhook request
+PUSH_READ_TIMEOUT = 5
+PUSH_MAX_BODY = 64 * 1024
 
 class FCSPStateMonitor:
     """Simple state monitor for FCSP device"""
     
-    def __init__(self, poll_interval=30):
+    def __init__(self, poll_interval=30, max_interval=300, state_file=STATE_CACHE_FILE,
+                 push_port=None, safety_interval=300, push_host='127.0.0.1'):
         """
         Initialize the state monitor
         
         Args:
             poll_interval: Polling interval in seconds (default: 30)
+            max_interval: Longest polling interval to back off to while the state is stable (default: 300)
+            state_file: Where to persist the last observed state ({host} is replaced with the
+                        configured device), or None to disable (default: STATE_CACHE_FILE)
+            push_port: Port to listen on for webhook pushes, or None to only poll (default: None)
+            safety_interval: Polling interval in seconds while pushes are arriving (default: 300)
+            push_host: Address the webhook listener binds to (default: 127.0.0.1)
         """
         self.poll_interval = poll_interval
+        self.max_interval = max(max_interval, poll_interval)
+        self._current_interval = poll_interval
+        self._stable_polls = 0  # Consecutive polls without a state change
         self.previous_state = None
         self.previous_inverter_states = None
+        self.previous_snapshot_hash = None  # Hash of (state, inverter states) for cheap change checks
         self.running = False
+        self._loop = None  # Event loop running monitor()
+        self._stop = None  # asyncio.Event set on shutdown to wake the loop immediately
         self.device_offline = False  # Track if device is offline
         self.consecutive_errors = 0  # Track consecutive connection failures
+        self._last_digest = None  # Digest of the last fully fetched state
+        self._digest_supported = True  # Cleared if the device offers no digest
+        self._revalidate_charger = True  # Cleared while the last charger payload had no state
+        if state_file is not None:
+            state_file = Path(str(state_file).format(host=get_config().get("host"))).expanduser()
+        self.state_file = state_file
+        self._restored_at = None  # Timestamp of the persisted state we started from, if any
+        self.push_port = push_port
+        self.push_host = push_host
+        self.safety_interval = safety_interval
+        self._push_server = None
+        self._wake = None  # asyncio.Event set by a push to trigger an immediate poll
+        self._last_push = None  # Event loop time of the last push received
+        self._last_poll = None  # Event loop time of the last poll, to rate-limit push-triggered polls
+        
+        # Pre-bound for the state change message
+        self._now = datetime.now
+        
+        self._load_state()
         
         # Setup signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -60,44 +142,155 @@ class FCSPStateMonitor:
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals"""
         print(f"\n👋 Received signal {signum}, shutting down gracefully...")
+        sys.stdout.flush()
         self.running = False
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stop.set)
+    
+    def _load_state(self):
+        """Restore the last observed state if it was saved recently enough to still be a valid baseline"""
+        if self.state_file is None:
+            return
+        
+        try:
+            # Polls can be up to max_interval apart, so allow a couple of those
+            saved_at = self.state_file.stat().st_mtime
+            if time.time() - saved_at > 2 * self.max_interval:
+                return
+            with open(self.state_file, 'r') as f:
+                cached = json.load(f)
+            state = cached['state']
+            inverters = tuple(cached['inverters'])
+            snapshot_hash = hash((state, inverters))  # Fails on hand-edited list/dict values
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        
+        self.previous_state = state
+        self.previous_inverter_states = inverters
+        self.previous_snapshot_hash = snapshot_hash
+        # The file is only rewritten on changes; its mtime is when the state was last seen
+        self._restored_at = datetime.fromtimestamp(saved_at).isoformat(timespec='seconds')
+    
+    def _save_state(self, changed):
+        """
+        Persist the last observed state
+        
+        Args:
+            changed: Whether the state changed since it was last saved; if not, only the
+                     file's modification time is refreshed to keep it from going stale
+        """
+        if self.state_file is None:
+            return
+        
+        if not changed:
+            try:
+                os.utime(self.state_file)
+                return
+            except OSError:
+                pass  # File is missing (e.g. removed); write it again below
+        
+        cached = {
+            'state': self.previous_state,
+            'inverters': list(self.previous_inverter_states),
+            'timestamp': datetime.now().isoformat(timespec='seconds')
+        }
+        tmp_file = self.state_file.with_name(self.state_file.name + '.tmp')
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, 'w') as f:
+                json.dump(cached, f, separators=(',', ':'))
+            os.replace(tmp_file, self.state_file)
+        except OSError:
+            pass  # Persisting is best-effort; monitoring carries on without it
     
-    def get_current_state(self):
+    async def get_current_state(self, fcsp):
         """
         Get current device state
         
+        Args:
+            fcsp: Connected AsyncFCSP client to query
+            
         Returns:
             tuple: (device_state, inverter_states) or (None, None) on error
         """
         try:
-            with FCSP() as fcsp:
-                charger_info = fcsp.get_charger_info()
-                inverter_info = fcsp.get_inverter_info()
-                
-                device_state = charger_info.get('state')
-                inverter_states = [inv.get('state') for inv in inverter_info]
-                
-                # Reset error counters on successful connection
-                if self.device_offline:
-                    print(f"🟢 Device is back online!")
-                    self.device_offline = False
-                    self.consecutive_errors = 0
-                
-                return device_state, inverter_states
-                
+            digest = await self._fetch_digest(fcsp)
+            if digest is not None and digest == self._last_digest:
+                # Nothing changed since the last full fetch
+                charger_info = inverter_info = None
+            else:
+                # Conditional requests come back as None when the device reports no change
+                charger_info, inverter_info = await asyncio.gather(
+                    fcsp.get_charger_info(only_if_changed=self._revalidate_charger),
+                    fcsp.get_inverter_info(only_if_changed=True)
+                )
         except Exception as e:
-            self.consecutive_errors += 1
-            
-            # Only show error message for first few failures
-            if self.consecutive_errors <= 3:
-                print(f"❌ Error getting state: {e}")
-            elif self.consecutive_errors == 4:
-                print(f"🔴 Device appears to be offline. Will continue monitoring for reconnection...")
-                self.device_offline = True
-            elif self.consecutive_errors % 10 == 0:  # Show message every 10th error
-                print(f"⏳ Still waiting for device to come back online... ({self.consecutive_errors} attempts)")
-            
+            self._report_error(e)
             return None, None
+        
+        if charger_info is None:
+            device_state = self.previous_state
+        else:
+            device_state = charger_info.get('state')
+        
+        # Only a usable state may serve as the baseline for later "no change" answers
+        self._revalidate_charger = device_state is not None
+        if device_state is not None:
+            self._last_digest = digest
+        
+        if inverter_info is None:
+            inverter_states = self.previous_inverter_states
+        else:
+            inverter_states = tuple(map(_get_state, inverter_info))
+        
+        # Reset error counters on successful connection
+        if self.device_offline:
+            print(f"🟢 Device is back online!")
+            self.device_offline = False
+        self.consecutive_errors = 0
+        
+        return device_state, inverter_states
+    
+    async def _fetch_digest(self, fcsp):
+        """
+        Fetch a cheap digest of the device state before pulling full payloads
+        
+        Args:
+            fcsp: Connected AsyncFCSP client to query
+            
+        Returns:
+            str: State digest, or None if the device doesn't provide one (this poll)
+        """
+        if not self._digest_supported:
+            return None
+        
+        try:
+            digest = await fcsp.get_state_digest()
+        except FCSPAPIError:
+            # The precheck is only an optimisation; fall back to the full fetch for this poll
+            return None
+        if digest is None:
+            # Device doesn't expose a digest; rely on (conditional) full fetches
+            self._digest_supported = False
+        return digest
+    
+    def _report_error(self, error):
+        """
+        Track a failed connection or request and report it without flooding the output
+        
+        Args:
+            error: The exception raised while talking to the device
+        """
+        self.consecutive_errors += 1
+        
+        # Only show error message for first few failures
+        if self.consecutive_errors <= 3:
+            print(f"❌ Error getting state: {error}")
+        elif self.consecutive_errors == 4:
+            print(f"🔴 Device appears to be offline. Will continue monitoring for reconnection...")
+            self.device_offline = True
+        elif self.consecutive_errors % 10 == 0:  # Show message every 10th error
+            print(f"⏳ Still waiting for device to come back online... ({self.consecutive_errors} attempts)")
     
     def format_state_change(self, old_state, new_state, old_inverters, new_inverters):
         """
@@ -112,89 +305,247 @@ class FCSPStateMonitor:
         Returns:
             str: Formatted state change message
         """
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = self._now().isoformat(sep=' ', timespec='seconds')
         
         # Get state information
-        old_info = DEVICE_STATES.get(old_state, {'name': f'Unknown ({old_state})', 'icon': '❓'})
-        new_info = DEVICE_STATES.get(new_state, {'name': f'Unknown ({new_state})', 'icon': '❓'})
+        old_icon, old_name = _state_label(old_state)
+        new_icon, new_name = _state_label(new_state)
         
         lines = [
             f"\n🔔 [{timestamp}] STATE CHANGE DETECTED!",
-            f"   Device: {old_info['icon']} {old_state} ({old_info['name']}) → {new_info['icon']} {new_state} ({new_info['name']})"
+            f"   Device: {old_icon} {old_state} ({old_name}) → {new_icon} {new_state} ({new_name})"
         ]
         
         # Add inverter changes if they changed
         if old_inverters != new_inverters:
-            lines.append(f"   Inverters: {old_inverters} → {new_inverters}")
+            lines.append(f"   Inverters: {list(old_inverters)} → {list(new_inverters)}")
         
         return "\n".join(lines)
     
-    def monitor(self):
-        """Main monitoring loop"""
-        print(f"🔌 FCSP State Monitor")
-        print(f"📡 Polling every {self.poll_interval} seconds")
-        print(f"🎯 Press Ctrl+C to stop")
-        print(f"💡 Monitor will automatically recover when device comes back online")
-        print(f"{'='*50}")
+    def _update_interval(self, changed):
+        """
+        Adapt the polling interval to how stable the state has been
         
-        self.running = True
+        Args:
+            changed: Whether the last poll saw a state change
+        """
+        if changed:
+            # Poll quickly again while things are happening
+            self._current_interval = self.poll_interval
+            self._stable_polls = 0
+            return
+        
+        self._stable_polls += 1
+        if self._stable_polls >= BACKOFF_AFTER_STABLE_POLLS:
+            self._current_interval = min(self._current_interval * 2, self.max_interval)
+            self._stable_polls = 0
+    
+    async def _wait(self, seconds, wake_on_push=False):
+        """
+        Wait for the given time, waking early if shutdown is requested (or a push arrives)
+        
+        Args:
+            seconds: Time to wait in seconds
+            wake_on_push: Also wake when a push arrives; only used between successful polls
+            
+        Returns:
+            bool: True if shutdown was requested
+        """
+        deadline = self._loop.time() + seconds
+        push_wake = self._wake if wake_on_push else None
+        
+        if push_wake is not None and self._last_poll is not None:
+            # Pushes can't trigger polls more often than poll_interval; until
+            # then only shutdown ends the wait early
+            earliest = min(self._last_poll + self.poll_interval, deadline)
+            try:
+                await asyncio.wait_for(self._stop.wait(), max(0, earliest - self._loop.time()))
+                return True
+            except asyncio.TimeoutError:
+                pass
+        
+        waiters = [asyncio.ensure_future(self._stop.wait())]
+        if push_wake is not None:
+            waiters.append(asyncio.ensure_future(push_wake.wait()))
         
-        # Get initial state
-        print("🔍 Getting initial state...")
-        initial_state, initial_inverters = self.get_current_state()
+        await asyncio.wait(waiters, timeout=max(0, deadline - self._loop.time()),
+                           return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters:
+            waiter.cancel()
+        if push_wake is not None:
+            # The poll that follows covers any push received so far
+            push_wake.clear()
+        return self._stop.is_set()
+    
+    def _next_interval(self):
+        """
+        Pick how long to wait before the next poll
+        
+        Returns:
+            float: Wait time in seconds
+        """
+        if self._last_push is not None and self._loop.time() - self._last_push < PUSH_GRACE_PERIOD:
+            # Pushes are arriving; polling is only a safety net
+            return self.safety_interval
+        return self._current_interval
+    
+    async def _handle_push(self, reader, writer):
+        """
+        Handle a webhook request announcing that the device state may have changed
+        
+        Args:
+            reader: Stream reader for the incoming connection
+            writer: Stream writer for the incoming connection
+        """
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), PUSH_READ_TIMEOUT)
+            
+            # Consume the headers and body; their contents aren't needed
+            content_length = 0
+            while True:
+                line = await asyncio.wait_for(reader.readline(), PUSH_READ_TIMEOUT)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length' and value.strip().isdigit():
+                    content_length = int(value)
+            if 0 < content_length <= PUSH_MAX_BODY:
+                await asyncio.wait_for(reader.readexactly(content_length), PUSH_READ_TIMEOUT)
+            
+            is_push = request_line.startswith(b'POST ')
+            status = b"204 No Content" if is_push else b"405 Method Not Allowed"
+            writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return  # Malformed, oversized (ValueError from readline) or abandoned request
+        finally:
+            writer.close()
         
-        if initial_state is None:
-            print("❌ Failed to get initial state. Exiting.")
+        if is_push:
+            self._last_push = self._loop.time()
+            self._wake.set()
+    
+    async def _start_push_listener(self):
+        """Start the webhook listener if push mode is enabled"""
+        if self.push_port is None:
             return
         
-        self.previous_state = initial_state
-        self.previous_inverter_states = initial_inverters
+        self._wake = asyncio.Event()
+        self._push_server = await asyncio.start_server(self._handle_push, host=self.push_host, port=self.push_port)
+        print(f"📬 Listening for pushes on {self.push_host}:{self.push_port} (polling every {self.safety_interval} seconds while they arrive)")
+    
+    async def _stop_push_listener(self):
+        """Stop the webhook listener"""
+        if self._push_server is None:
+            return
         
-        # Show initial state
-        initial_info = DEVICE_STATES.get(initial_state, {'name': f'Unknown ({initial_state})', 'icon': '❓'})
-        print(f"📊 Initial state: {initial_info['icon']} {initial_state} - {initial_info['name']}")
-        print(f"🔄 Starting monitoring loop...\n")
+        self._push_server.close()
+        await self._push_server.wait_closed()
+        self._push_server = None
+    
+    async def _poll(self, fcsp):
+        """
+        Poll the device over an open session until shutdown or a failed request
         
-        # Main monitoring loop
+        Args:
+            fcsp: Connected AsyncFCSP client to poll
+        """
         while self.running:
-            try:
-                # Sleep in shorter intervals to allow for graceful shutdown
-                sleep_remaining = self.poll_interval
-                while sleep_remaining > 0 and self.running:
-                    sleep_chunk = min(sleep_remaining, 1.0)  # Check every 1 second
-                    time.sleep(sleep_chunk)
-                    sleep_remaining -= sleep_chunk
-                
-                if not self.running:
+            # Get current state
+            self._last_poll = self._loop.time()
+            current_state, current_inverters = await self.get_current_state(fcsp)
+            
+            if current_state is None:
+                if self.consecutive_errors:
+                    return  # Request failed; drop this session and reconnect
+                # Device answered without a state; skip this poll but keep the session
+                sys.stdout.flush()
+                if await self._wait(self.poll_interval, wake_on_push=True):
                     break
+                continue
+            
+            snapshot_hash = hash((current_state, current_inverters))
+            changed = snapshot_hash != self.previous_snapshot_hash
+            
+            if self.previous_state is None:
+                # Show initial state
+                initial_icon, initial_name = _state_label(current_state)
+                print(f"📊 Initial state: {initial_icon} {current_state} - {initial_name}")
+                print(f"🔄 Starting monitoring loop...\n")
                 
-                # Get current state
-                current_state, current_inverters = self.get_current_state()
-                
-                if current_state is None:
-                    continue  # Skip this iteration on error
+            # Check for changes; the common no-change path does no formatting at all
+            elif changed:
                 
-                # Check for changes
-                if (current_state != self.previous_state or 
-                    current_inverters != self.previous_inverter_states):
-                    
-                    # Report the change
-                    change_message = self.format_state_change(
-                        self.previous_state, current_state,
-                        self.previous_inverter_states, current_inverters
-                    )
-                    print(change_message)
+                # Report the change
+                change_message = self.format_state_change(
+                    self.previous_state, current_state,
+                    self.previous_inverter_states, current_inverters
+                )
+                sys.stdout.write(change_message + "\n")
+            
+            # Update previous states (raw states are kept for the change message)
+            self.previous_state = current_state
+            self.previous_inverter_states = current_inverters
+            self.previous_snapshot_hash = snapshot_hash
+            self._save_state(changed)
+            
+            self._update_interval(changed)
+            sys.stdout.flush()  # One write per poll rather than per line
+            if await self._wait(self._next_interval(), wake_on_push=True):
+                break
+    
+    async def monitor(self):
+        """Main monitoring loop"""
+        print(f"🔌 FCSP State Monitor")
+        print(f"📡 Polling every {self.poll_interval} seconds (up to {self.max_interval} seconds while idle)")
+        print(f"🎯 Press Ctrl+C to stop")
+        print(f"💡 Monitor will automatically recover when device comes back online")
+        print(f"{'='*50}")
+        
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        await self._start_push_listener()
+        
+        if self.previous_state is None:
+            # Get initial state
+            print("🔍 Getting initial state...")
+        else:
+            # Start from the state saved by the previous run
+            restored_icon, restored_name = _state_label(self.previous_state)
+            print(f"📊 Restored state from {self._restored_at}: {restored_icon} {self.previous_state} - {restored_name}")
+            print(f"🔄 Starting monitoring loop...\n")
+        
+        # Main monitoring loop. A single authenticated session is kept open
+        # across polls and only re-established after a failure.
+        while self.running:
+            try:
+                async with AsyncFCSP() as fcsp:
+                    await self._poll(fcsp)
                     
-                    # Update previous states
-                    self.previous_state = current_state
-                    self.previous_inverter_states = current_inverters
-                
             except KeyboardInterrupt:
                 break
+            except FCSPError as e:
+                self._report_error(e)
             except Exception as e:
                 print(f"❌ Unexpected error in monitoring loop: {e}")
-                time.sleep(5)  # Wait a bit before retrying
+                self.consecutive_errors += 1  # Back off on repeated failures like any other error
+            
+            if self.previous_state is None and self.running:
+                print("❌ Failed to get initial state. Exiting.")
+                await self._stop_push_listener()
+                return
+            
+            # Back off exponentially (with jitter) before reconnecting, and
+            # poll at the base rate until the state settles again
+            self._current_interval = self.poll_interval
+            self._stable_polls = 0
+            backoff = min(MAX_RETRY_BACKOFF, 2 ** self.consecutive_errors) + random.uniform(0, 1)
+            sys.stdout.flush()
+            if await self._wait(backoff):
+                break
         
+        await self._stop_push_listener()
         print(f"\n👋 Monitoring stopped")
 
 def main():
@@ -202,13 +553,36 @@ def main():
     parser = argparse.ArgumentParser(description="FCSP State Monitor")
     parser.add_argument("--interval", "-i", type=int, default=30, 
                        help="Polling interval in seconds (default: 30)")
+    parser.add_argument("--max-interval", "-m", type=int, default=300,
+                       help="Maximum polling interval while the state is stable (default: 300)")
+    parser.add_argument("--push", action="store_true",
+                       help="Also listen for webhook POSTs that trigger an immediate poll")
+    parser.add_argument("--push-port", type=int, default=8787,
+                       help="Port for the webhook listener in push mode (default: 8787)")
+    parser.add_argument("--push-host", default="127.0.0.1",
+                       help="Address for the webhook listener in push mode (default: 127.0.0.1, use 0.0.0.0 for all interfaces)")
+    parser.add_argument("--safety-interval", type=int, default=300,
+                       help="Polling interval in seconds while pushes are arriving (default: 300)")
     parser.add_argument("--config", help="Path to configuration file")
     
     args = parser.parse_args()
     
+    if not sys.stdout.isatty():
+        # Logging to a file or journald: buffer output and let the monitor
+        # flush it once per poll instead of writing each line separately
+        sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', buffering=1 << 16,
+                               encoding=sys.stdout.encoding, closefd=False)
+        atexit.register(sys.stdout.flush)
+    
     try:
-        monitor = FCSPStateMonitor(poll_interval=args.interval)
-        monitor.monitor()
+        monitor = FCSPStateMonitor(
+            poll_interval=args.interval,
+            max_interval=args.max_interval,
+            push_port=args.push_port if args.push else None,
+            safety_interval=args.safety_interval,
+            push_host=args.push_host
+        )
+        asyncio.run(monitor.monitor())
         
     except Exception as e:
         print(f"❌ Failed to start monitor: {e}")
@@ -6,6 +6,7 @@ via their REST API, including authentication, device monitoring, and configurati
 """
 
 from .client import FCSP, FCSPError, FCSPAuthenticationError, FCSPConnectionError, FCSPAPIError
+from .async_client import AsyncFCSP
 from .config import FCSPConfig, get_config, get_devkey, get_credentials, get_connection_settings, create_config_file
 
 __version__ = "0.1.3"
@@ -15,6 +16,7 @@ __email__ = "eric@ericpullen.com"
 # Main exports
 __all__ = [
     "FCSP",
+    "AsyncFCSP",
     "FCSPError", 
     "FCSPAuthenticationError",
     "FCSPConnectionError", 
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+FCSP Async API Client
+asyncio client for the state endpoints of Ford Charge Station Pro (FCSP) devices
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+import socket
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+
+from .client import FCSPError, FCSPAuthenticationError, FCSPConnectionError, FCSPAPIError
+from .client import _KEEPALIVE_SOCKET_OPTIONS
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import orjson  # Optional: faster parsing of the polled state endpoints
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# How long an idle pooled connection is kept open. aiohttp's default of 15
+# seconds is shorter than a typical poll interval; the TCP keepalive probes
+# below keep NAT/firewall mappings open for that long.
+_KEEPALIVE_TIMEOUT = 600
+
+# aiohttp 3.12+ lets us create the sockets, which is needed to set the same
+# TCP keepalive options as the sync client
+_HAS_SOCKET_FACTORY = (aiohttp is not None and
+                       "socket_factory" in inspect.signature(aiohttp.TCPConnector.__init__).parameters)
+
+
+def _keepalive_socket(addr_info) -> socket.socket:
+    """Create a client socket with TCP keepalive enabled (aiohttp socket_factory)"""
+    family, type_, proto, _, _ = addr_info
+    sock = socket.socket(family=family, type=type_, proto=proto)
+    for level, option, value in _KEEPALIVE_SOCKET_OPTIONS:
+        sock.setsockopt(level, option, value)
+    return sock
+
+
+def _parse_json(body: bytes) -> Any:
+    """Parse a JSON response body, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class AsyncFCSP:
+    """
+    Asynchronous Ford Charge Station Pro API Client
+    
+    asyncio counterpart of FCSP for monitoring the charger and inverter state.
+    Handles authentication and token refresh the same way. Requires aiohttp.
+    """
+    
+    def __init__(self, host: str = None, devkey: str = None, port: int = None, timeout: int = None,
+                 connect_timeout: int = None):
+        """
+        Initialize async FCSP client
+        
+        Args:
+            host: IP address or hostname of the FCSP device (default: from config)
+            devkey: Developer key required for API access (default: from config)
+            port: HTTPS port (default: from config or 443)
+            timeout: Request timeout in seconds (default: from config or 10)
+            connect_timeout: Connection timeout in seconds (default: from config or 3)
+        """
+        if aiohttp is None:
+            raise FCSPError("aiohttp library required for AsyncFCSP. Install with: pip install aiohttp")
+        
+        # Import config here to avoid circular imports
+        from .config import get_config, get_devkey, get_connection_settings
+        
+        config = get_config()
+        conn_settings = get_connection_settings()
+        
+        self.host = host or config.get("host")
+        if not self.host:
+            raise FCSPError("Host is required. Provide host parameter or set 'host' in configuration.")
+        
+        self.devkey = devkey or get_devkey()
+        if not self.devkey:
+            raise FCSPError("Developer key is required. Provide devkey parameter or set 'devkey' in configuration.")
+        
+        self.port = port or conn_settings.get("port", 443)
+        self.timeout = timeout or conn_settings.get("timeout", 10)
+        self.connect_timeout = connect_timeout or conn_settings.get("connect_timeout") or 3
+        
+        # Build base URL
+        self.base_url = f"https://{self.host}:{self.port}" if self.port != 443 else f"https://{self.host}"
+        
+        # Session is created on connect(), inside the running event loop
+        self.session: Optional["aiohttp.ClientSession"] = None
+        
+        # Token management
+        self.access_token: Optional[str] = None
+        self.refresh_token: Optional[str] = None
+        self.token_expires_at: Optional[datetime] = None
+        self._auth_lock: Optional[asyncio.Lock] = None
+        
+        # Cache validators (ETag / Last-Modified) per endpoint for conditional GETs
+        self._validators: Dict[str, Dict[str, str]] = {}
+    
+    async def __aenter__(self):
+        """Async context manager entry"""
+        try:
+            await self.connect()
+        except BaseException:
+            await self.disconnect()
+            raise
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit"""
+        await self.disconnect()
+    
+    async def connect(self) -> bool:
+        """
+        Connect and authenticate with the FCSP device
+        
+        Returns:
+            bool: True if authentication successful
+        
+        Raises:
+            FCSPAuthenticationError: If authentication fails
+            FCSPConnectionError: If connection fails
+        """
+        logger.info(f"Connecting to FCSP device at {self.host}")
+        
+        if self.session is None:
+            if _HAS_SOCKET_FACTORY:
+                connector = aiohttp.TCPConnector(ssl=False, keepalive_timeout=_KEEPALIVE_TIMEOUT,
+                                                 socket_factory=_keepalive_socket)
+            else:
+                # Without TCP keepalive, keep aiohttp's short idle timeout so
+                # pooled connections don't outlive NAT/firewall mappings
+                logger.debug("aiohttp < 3.12: TCP keepalive not available for AsyncFCSP")
+                connector = aiohttp.TCPConnector(ssl=False)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.timeout)
+            )
+            self._auth_lock = asyncio.Lock()
+        
+        try:
+            async with self.session.post(f"{self.base_url}/api/v1/access", json={"devkey": self.devkey}) as response:
+                if response.status == 200:
+                    data = _parse_json(await response.read())
+                    self.access_token = data.get("access")
+                    self.refresh_token = data.get("refresh")
+                    
+                    # Estimate token expiration (JWT tokens typically expire in 1 hour)
+                    self.token_expires_at = datetime.now() + timedelta(minutes=50)
+                    
+                    logger.info("Successfully authenticated with FCSP device")
+                    return True
+                else:
+                    error_msg = f"Authentication failed: {response.status} - {await response.text()}"
+                    logger.error(error_msg)
+                    raise FCSPAuthenticationError(error_msg)
+        
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error_msg = f"Connection failed: {e}"
+            logger.error(error_msg)
+            raise FCSPConnectionError(error_msg)
+    
+    async def disconnect(self):
+        """Disconnect from the FCSP device and close the HTTP session"""
+        self.access_token = None
+        self.refresh_token = None
+        self.token_expires_at = None
+        self._validators = {}
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        logger.info("Disconnected from FCSP device")
+    
+    async def _ensure_authenticated(self):
+        """Ensure we have a valid authentication token"""
+        if not self.access_token:
+            raise FCSPAuthenticationError("Not authenticated. Call connect() first.")
+        
+        # Check if token is about to expire
+        if self.token_expires_at and datetime.now() >= self.token_expires_at:
+            async with self._auth_lock:
+                # Another task may have refreshed while we waited for the lock
+                if self.token_expires_at and datetime.now() >= self.token_expires_at:
+                    logger.info("Token expired, refreshing...")
+                    await self._refresh_token()
+    
+    async def _refresh_token(self):
+        """Refresh the authentication token"""
+        if not self.refresh_token:
+            # No refresh token, need to re-authenticate
+            await self.connect()
+            return
+        
+        try:
+            async with self.session.post(f"{self.base_url}/api/v1/refresh", json={"refresh": self.refresh_token}) as response:
+                if response.status == 200:
+                    data = _parse_json(await response.read())
+                    self.access_token = data.get("access", self.access_token)
+                    self.refresh_token = data.get("refresh", self.refresh_token)
+                    self.token_expires_at = datetime.now() + timedelta(minutes=50)
+                    logger.info("Token refreshed successfully")
+                    return
+            
+            # Refresh failed, re-authenticate
+            logger.warning("Token refresh failed, re-authenticating...")
+            await self.connect()
+        
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Network error, re-authenticate
+            logger.warning("Token refresh failed due to network error, re-authenticating...")
+            await self.connect()
+    
+    async def _make_request(self, endpoint: str, method: str = "GET",
+                            conditional: bool = False) -> "aiohttp.ClientResponse":
+        """
+        Make an authenticated request to the FCSP API
+        
+        The response body is read before returning, so the connection is already
+        back in the pool and the body is available via ``await response.read()``.
+        
+        Args:
+            endpoint: API endpoint (without leading slash)
+            method: HTTP method (GET or HEAD)
+            conditional: Send the validators from the last response to this endpoint
+                (If-None-Match / If-Modified-Since) so the device can answer 304
+        
+        Returns:
+            aiohttp.ClientResponse: The response object
+        
+        Raises:
+            FCSPAPIError: If the API returns an error
+            FCSPConnectionError: If connection fails
+        """
+        if method.upper() not in ("GET", "HEAD"):
+            raise FCSPAPIError(f"Unsupported HTTP method: {method}")
+        
+        await self._ensure_authenticated()
+        
+        url = f"{self.base_url}/{endpoint}"
+        sent_token = self.access_token
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {sent_token}"
+        }
+        if conditional:
+            headers.update(self._validators.get(endpoint, {}))
+        
+        try:
+            response = await self.session.request(method.upper(), url, headers=headers)
+            await response.read()
+            
+            # Handle common error responses
+            if response.status == 401:
+                # Token expired or invalid, try to refresh
+                async with self._auth_lock:
+                    # Skip if another task already refreshed after our request was sent
+                    if self.access_token == sent_token:
+                        await self._refresh_token()
+                # Retry the request once
+                headers["Authorization"] = f"Bearer {self.access_token}"
+                response = await self.session.request(method.upper(), url, headers=headers)
+                await response.read()
+            
+            if conditional and response.status == 200:
+                # Devices that don't emit validators simply never get conditional headers
+                validators = {}
+                if response.headers.get("ETag"):
+                    validators["If-None-Match"] = response.headers["ETag"]
+                if response.headers.get("Last-Modified"):
+                    validators["If-Modified-Since"] = response.headers["Last-Modified"]
+                self._validators[endpoint] = validators
+            
+            return response
+        
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error_msg = f"Request failed for {endpoint}: {e}"
+            logger.error(error_msg)
+            raise FCSPConnectionError(error_msg)
+    
+    async def get_charger_info(self, only_if_changed: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get charger information including hardware/software versions, network info, etc.
+        
+        Args:
+            only_if_changed: Revalidate against the previous response and return None
+                if the device reports it unchanged (HTTP 304)
+        
+        Returns:
+            dict: Charger information, or None if unchanged
+        """
+        response = await self._make_request("api/v1/chargerinfo", conditional=only_if_changed)
+        if response.status == 304 and only_if_changed:
+            return None
+        if response.status == 200:
+            return _parse_json(await response.read())
+        else:
+            raise FCSPAPIError(f"Failed to get charger info: {response.status} - {await response.text()}")
+    
+    async def get_inverter_info(self, only_if_changed: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get inverter information including vendor, model, firmware, state, etc.
+        
+        Args:
+            only_if_changed: Revalidate against the previous response and return None
+                if the device reports it unchanged (HTTP 304)
+        
+        Returns:
+            list: List of inverter information dictionaries, or None if unchanged
+        """
+        response = await self._make_request("api/v1/inverterinfo", conditional=only_if_changed)
+        if response.status == 304 and only_if_changed:
+            return None
+        if response.status == 200:
+            return _parse_json(await response.read())
+        else:
+            raise FCSPAPIError(f"Failed to get inverter info: {response.status} - {await response.text()}")
+    
+    async def get_state_digest(self) -> Optional[str]:
+        """
+        Get a cheap fingerprint of the charger and inverter state using HEAD requests
+        
+        Built from the ETag, Content-MD5 or Last-Modified header of each endpoint,
+        so no response body is transferred.
+        
+        Returns:
+            str: Combined digest, or None if the device doesn't provide one
+        
+        Raises:
+            FCSPAPIError: If a HEAD request fails transiently (401, 408, 429 or 5xx)
+        """
+        responses = await asyncio.gather(
+            self._make_request("api/v1/chargerinfo", method="HEAD"),
+            self._make_request("api/v1/inverterinfo", method="HEAD")
+        )
+        
+        digests = []
+        for response in responses:
+            if response.status == 501 or (400 <= response.status < 500 and
+                                          response.status not in (401, 408, 429)):
+                return None  # HEAD not supported (e.g. 404/405 from embedded servers)
+            if response.status != 200:
+                raise FCSPAPIError(f"Failed to get state digest: {response.status}")
+            
+            digest = (response.headers.get("ETag") or
+                      response.headers.get("Content-MD5") or
+                      response.headers.get("Last-Modified"))
+            if not digest:
+                return None
+            digests.append(digest)
+        
+        return "|".join(digests)
+    
+    def __repr__(self) -> str:
+        """String representation of the async FCSP client"""
+        status = "connected" if self.access_token else "disconnected"
+        return f"AsyncFCSP(host='{self.host}', status='{status}')"
@@ -6,12 +6,21 @@ Main client class for interacting with Ford Charge Station Pro (FCSP) devices
 
 import requests
 import json
+import socket
 import time
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
 import logging
 
+try:
+    import orjson  # Optional: faster parsing of the polled state endpoints
+except ImportError:
+    orjson = None
+
 # Disable SSL warnings for self-signed certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -38,6 +47,30 @@ class FCSPAPIError(FCSPError):
     pass
 
 
+# Keep idle connections alive so a long-lived session notices dead peers (and
+# NAT/firewall mappings stay open) between polls. The per-probe timings are
+# only available on some platforms.
+_KEEPALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+for _name, _value in (("TCP_KEEPIDLE", 15), ("TCP_KEEPINTVL", 5), ("TCP_KEEPCNT", 3)):
+    if hasattr(socket, _name):
+        _KEEPALIVE_SOCKET_OPTIONS.append((socket.IPPROTO_TCP, getattr(socket, _name), _value))
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTP adapter that enables TCP keepalive on pooled connections"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + _KEEPALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _parse_json(response: requests.Response) -> Any:
+    """Parse a JSON response body, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
 class FCSP:
     """
     Ford Charge Station Pro API Client
@@ -46,7 +79,8 @@ class FCSP:
     Handles authentication, token refresh, and provides methods for all known endpoints.
     """
     
-    def __init__(self, host: str = None, devkey: str = None, port: int = None, timeout: int = None):
+    def __init__(self, host: str = None, devkey: str = None, port: int = None, timeout: int = None,
+                 connect_timeout: int = None):
         """
         Initialize FCSP client
         
@@ -55,6 +89,7 @@ class FCSP:
             devkey: Developer key required for API access (default: from config)
             port: HTTPS port (default: from config or 443)
             timeout: Request timeout in seconds (default: from config or 10)
+            connect_timeout: Connection timeout in seconds (default: from config or 3)
         """
         # Import config here to avoid circular imports
         from .config import get_config, get_devkey, get_connection_settings
@@ -81,21 +116,34 @@ class FCSP:
             self.port = port
             self.timeout = timeout
         
+        if connect_timeout is None:
+            connect_timeout = get_connection_settings().get("connect_timeout") or 3
+        self.connect_timeout = connect_timeout
+        
+        # Fail fast on an unreachable device, but allow a slower response once connected
+        self._request_timeout = (self.connect_timeout, self.timeout)
+        
         # Build base URL
         self.base_url = f"https://{self.host}:{self.port}" if self.port != 443 else f"https://{self.host}"
         
         # Setup session
         self.session = requests.Session()
         self.session.verify = False  # Ignore SSL certificate errors
+        self.session.mount("https://", _KeepAliveAdapter())
         
         # Token management
         self.access_token: Optional[str] = None
         self.refresh_token: Optional[str] = None
         self.token_expires_at: Optional[datetime] = None
+        # Serializes token refreshes when requests are issued from several threads
+        self._auth_lock = threading.Lock()
         
         # Device info cache
         self._device_info: Optional[Dict] = None
         self._last_info_fetch: Optional[datetime] = None
+        
+        # Cache validators (ETag / Last-Modified) per endpoint for conditional GETs
+        self._validators: Dict[str, Dict[str, str]] = {}
     
     @classmethod
     def from_config(cls, config_file: str = None):
@@ -147,7 +195,7 @@ class FCSP:
             response = self.session.post(
                 f"{self.base_url}/api/v1/access",
                 json=auth_data,
-                timeout=self.timeout
+                timeout=self._request_timeout
             )
             
             if response.status_code == 200:
@@ -176,6 +224,7 @@ class FCSP:
         self.refresh_token = None
         self.token_expires_at = None
         self._device_info = None
+        self._validators = {}
         logger.info("Disconnected from FCSP device")
     
     def _ensure_authenticated(self):
@@ -185,8 +234,11 @@ class FCSP:
         
         # Check if token is about to expire
         if self.token_expires_at and datetime.now() >= self.token_expires_at:
-            logger.info("Token expired, refreshing...")
-            self._refresh_token()
+            with self._auth_lock:
+                # Another thread may have refreshed while we waited for the lock
+                if self.token_expires_at and datetime.now() >= self.token_expires_at:
+                    logger.info("Token expired, refreshing...")
+                    self._refresh_token()
     
     def _refresh_token(self):
         """Refresh the authentication token"""
@@ -199,7 +251,7 @@ class FCSP:
             response = self.session.post(
                 f"{self.base_url}/api/v1/refresh",
                 json={"refresh": self.refresh_token},
-                timeout=self.timeout
+                timeout=self._request_timeout
             )
             
             if response.status_code == 200:
@@ -218,14 +270,17 @@ class FCSP:
             logger.warning("Token refresh failed due to network error, re-authenticating...")
             self.connect()
     
-    def _make_request(self, endpoint: str, method: str = "GET", data: Optional[Dict] = None) -> requests.Response:
+    def _make_request(self, endpoint: str, method: str = "GET", data: Optional[Dict] = None,
+                      conditional: bool = False) -> requests.Response:
         """
         Make an authenticated request to the FCSP API
         
         Args:
             endpoint: API endpoint (without leading slash)
-            method: HTTP method (GET, POST, etc.)
+            method: HTTP method (GET, POST, HEAD)
             data: Request data for POST requests
+            conditional: Send the validators from the last response to this endpoint
+                (If-None-Match / If-Modified-Since) so the device can answer 304
             
         Returns:
             requests.Response: The response object
@@ -237,29 +292,48 @@ class FCSP:
         self._ensure_authenticated()
         
         url = f"{self.base_url}/{endpoint}"
+        sent_token = self.access_token
         headers = {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.access_token}"
+            "Authorization": f"Bearer {sent_token}"
         }
+        if conditional:
+            headers.update(self._validators.get(endpoint, {}))
         
         try:
             if method.upper() == "GET":
-                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                response = self.session.get(url, headers=headers, timeout=self._request_timeout)
             elif method.upper() == "POST":
-                response = self.session.post(url, headers=headers, json=data or {}, timeout=self.timeout)
+                response = self.session.post(url, headers=headers, json=data or {}, timeout=self._request_timeout)
+            elif method.upper() == "HEAD":
+                response = self.session.head(url, headers=headers, timeout=self._request_timeout)
             else:
                 raise FCSPAPIError(f"Unsupported HTTP method: {method}")
             
             # Handle common error responses
             if response.status_code == 401:
                 # Token expired or invalid, try to refresh
-                self._refresh_token()
+                with self._auth_lock:
+                    # Skip if another thread already refreshed after our request was sent
+                    if self.access_token == sent_token:
+                        self._refresh_token()
                 # Retry the request once
                 headers["Authorization"] = f"Bearer {self.access_token}"
                 if method.upper() == "GET":
-                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+                    response = self.session.get(url, headers=headers, timeout=self._request_timeout)
+                elif method.upper() == "HEAD":
+                    response = self.session.head(url, headers=headers, timeout=self._request_timeout)
                 else:
-                    response = self.session.post(url, headers=headers, json=data or {}, timeout=self.timeout)
+                    response = self.session.post(url, headers=headers, json=data or {}, timeout=self._request_timeout)
+            
+            if conditional and response.status_code == 200:
+                # Devices that don't emit validators simply never get conditional headers
+                validators = {}
+                if response.headers.get("ETag"):
+                    validators["If-None-Match"] = response.headers["ETag"]
+                if response.headers.get("Last-Modified"):
+                    validators["If-Modified-Since"] = response.headers["Last-Modified"]
+                self._validators[endpoint] = validators
             
             return response
             
@@ -270,29 +344,41 @@ class FCSP:
     
     # Device Information Methods
     
-    def get_charger_info(self) -> Dict[str, Any]:
+    def get_charger_info(self, only_if_changed: bool = False) -> Optional[Dict[str, Any]]:
         """
         Get charger information including hardware/software versions, network info, etc.
         
+        Args:
+            only_if_changed: Revalidate against the previous response and return None
+                if the device reports it unchanged (HTTP 304)
+        
         Returns:
-            dict: Charger information
+            dict: Charger information, or None if unchanged
         """
-        response = self._make_request("api/v1/chargerinfo")
+        response = self._make_request("api/v1/chargerinfo", conditional=only_if_changed)
+        if response.status_code == 304 and only_if_changed:
+            return None
         if response.status_code == 200:
-            return response.json()
+            return _parse_json(response)
         else:
             raise FCSPAPIError(f"Failed to get charger info: {response.status_code} - {response.text}")
     
-    def get_inverter_info(self) -> List[Dict[str, Any]]:
+    def get_inverter_info(self, only_if_changed: bool = False) -> Optional[List[Dict[str, Any]]]:
         """
         Get inverter information including vendor, model, firmware, state, etc.
         
+        Args:
+            only_if_changed: Revalidate against the previous response and return None
+                if the device reports it unchanged (HTTP 304)
+        
         Returns:
-            list: List of inverter information dictionaries
+            list: List of inverter information dictionaries, or None if unchanged
         """
-        response = self._make_request("api/v1/inverterinfo")
+        response = self._make_request("api/v1/inverterinfo", conditional=only_if_changed)
+        if response.status_code == 304 and only_if_changed:
+            return None
         if response.status_code == 200:
-            return response.json()
+            return _parse_json(response)
         else:
             raise FCSPAPIError(f"Failed to get inverter info: {response.status_code} - {response.text}")
     
@@ -512,6 +598,37 @@ class FCSP:
             logger.error(f"Failed to get device summary: {e}")
             raise
     
+    def get_state_digest(self) -> Optional[str]:
+        """
+        Get a cheap fingerprint of the charger and inverter state using HEAD requests
+        
+        Built from the ETag, Content-MD5 or Last-Modified header of each endpoint,
+        so no response body is transferred.
+        
+        Returns:
+            str: Combined digest, or None if the device doesn't provide one
+            
+        Raises:
+            FCSPAPIError: If a HEAD request fails transiently (401, 408, 429 or 5xx)
+        """
+        digests = []
+        for endpoint in ("api/v1/chargerinfo", "api/v1/inverterinfo"):
+            response = self._make_request(endpoint, method="HEAD")
+            if response.status_code == 501 or (400 <= response.status_code < 500 and
+                                          response.status_code not in (401, 408, 429)):
+                return None  # HEAD not supported (e.g. 404/405 from embedded servers)
+            if response.status_code != 200:
+                raise FCSPAPIError(f"Failed to get state digest: {response.status_code} - {response.text}")
+            
+            digest = (response.headers.get("ETag") or
+                      response.headers.get("Content-MD5") or
+                      response.headers.get("Last-Modified"))
+            if not digest:
+                return None
+            digests.append(digest)
+        
+        return "|".join(digests)
+    
     def is_connected(self) -> bool:
         """
         Check if connected to the device
@@ -17,6 +17,7 @@ logger = logging.getLogger(__name__)
 DEFAULT_CONFIG = {
     "port": 443,
     "timeout": 10,
+    "connect_timeout": 3,
     "verify_ssl": False,
     "log_level": "INFO"
     # Note: devkey and host should be set in config file or environment variables
@@ -36,6 +37,7 @@ ENV_DEVKEY = "FCSP_DEVKEY"
 ENV_HOST = "FCSP_HOST"
 ENV_PORT = "FCSP_PORT"
 ENV_TIMEOUT = "FCSP_TIMEOUT"
+ENV_CONNECT_TIMEOUT = "FCSP_CONNECT_TIMEOUT"
 ENV_VERIFY_SSL = "FCSP_VERIFY_SSL"
 ENV_LOG_LEVEL = "FCSP_LOG_LEVEL"
 ENV_CONFIG_FILE = "FCSP_CONFIG_FILE"
@@ -108,6 +110,7 @@ class FCSPConfig:
             ENV_HOST: "host",
             ENV_PORT: "port",
             ENV_TIMEOUT: "timeout",
+            ENV_CONNECT_TIMEOUT: "connect_timeout",
             ENV_VERIFY_SSL: "verify_ssl",
             ENV_LOG_LEVEL: "log_level"
         }
@@ -116,7 +119,7 @@ class FCSPConfig:
             value = os.getenv(env_var)
             if value is not None:
                 # Convert types appropriately
-                if config_key in ["port", "timeout"]:
+                if config_key in ["port", "timeout", "connect_timeout"]:
                     try:
                         self._config[config_key] = int(value)
                     except ValueError:
@@ -150,6 +153,7 @@ class FCSPConfig:
         return {
             "port": self.get("port"),
             "timeout": self.get("timeout"),
+            "connect_timeout": self.get("connect_timeout"),
             "verify_ssl": self.get("verify_ssl")
         }
     
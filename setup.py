@@ -65,6 +65,12 @@ setup(
         "crypto": [
             "cryptography>=3.0.0",
         ],
+        "fast": [
+            "orjson>=3.0.0",
+        ],
+        "async": [
+            "aiohttp>=3.7.0",
+        ],
     },
     entry_points={
         "console_scripts": [